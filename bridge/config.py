@@ -11,6 +11,9 @@ class Settings(BaseSettings):
     bridge_host: str = "127.0.0.1"
     bridge_port: int = 8765
     permission_timeout: int = 300  # 5 minutes
+    # Public HTTPS URL of this daemon's /telegram endpoint; polling if unset
+    telegram_webhook_url: str | None = None
+    telegram_webhook_secret: str | None = None
 
     class Config:
         env_file = ".env"
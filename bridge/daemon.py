@@ -1,20 +1,23 @@
 """Main daemon that runs the bridge service."""
 
 import asyncio
+import hmac
 import logging
 import signal
 import sys
 import uuid
 from contextlib import asynccontextmanager
+from typing import Literal
 
+import anyio
 import uvicorn
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Request, Response
+from pydantic import BaseModel, ConfigDict
 
 from .config import settings
 from .state import state, PendingRequest
 from .sessions import sessions
-from .telegram_bot import bot
+from .telegram_bot import DECISION_TEMPLATE, bot, truncate
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,10 +25,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# anyio's default is 40 threads for sync endpoints and dependencies
+THREADPOOL_TOKENS = 100
+
 
 class PermissionRequestInput(BaseModel):
     """Input model for permission requests."""
 
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     request_id: str | None = None
     tool: str
     command: str
@@ -35,13 +43,17 @@ class PermissionRequestInput(BaseModel):
 class PermissionResponse(BaseModel):
     """Response model for permission decisions."""
 
-    decision: str
+    model_config = ConfigDict(frozen=True)
+
+    decision: Literal["allow", "deny"]
     reason: str | None = None
 
 
 class SessionEvent(BaseModel):
     """Input model for session events from hooks."""
 
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     session_id: str
     event: str  # SessionStart, Notification, Stop, etc.
     status: str | None = None
@@ -53,11 +65,21 @@ class SessionEvent(BaseModel):
     notification_type: str | None = None
 
 
+class SessionEventBatch(BaseModel):
+    """A burst of session events sent together by a hook."""
+
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
+    events: list[SessionEvent]
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifecycle."""
     # Startup
     logger.info("Starting Telegram Claude Bridge...")
+    # Room for bursts of hook events if any sync work lands in the threadpool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
     await bot.initialize()
     logger.info(
         f"Bridge listening on http://{settings.bridge_host}:{settings.bridge_port}"
@@ -83,17 +105,30 @@ async def health():
     return {"status": "ok", "pending": state.count(), "sessions": sessions.count()}
 
 
-@app.post("/session")
-async def session_event(data: SessionEvent):
+@app.post("/session", status_code=204)
+async def session_event(
+    data: SessionEventBatch | SessionEvent, background_tasks: BackgroundTasks
+):
     """
     Receive session events from Claude Code hooks.
 
-    This tracks session state and sends notifications to Telegram.
+    Accepts a single event or a batch, which is applied in order after the
+    response is sent, so hooks don't wait on Telegram.
     """
+    events = data.events if isinstance(data, SessionEventBatch) else [data]
+    for event in events:
+        background_tasks.add_task(handle_session_event, event)
+
+    # No body: hooks only check the status
+    return Response(status_code=204)
+
+
+async def handle_session_event(data: SessionEvent) -> None:
+    """Track session state and send notifications to Telegram."""
     logger.info(f"Session event: {data.event} for {data.session_id[:8]}...")
 
     # Update session state
-    session = await sessions.create_or_update(
+    session = sessions.create_or_update(
         session_id=data.session_id,
         tty=data.tty,
         cwd=data.cwd,
@@ -109,19 +144,47 @@ async def session_event(data: SessionEvent):
     elif data.event == "Notification":
         if data.notification_type == "idle_prompt":
             # Session is waiting for input - update message and notify
-            session.update(status="waiting_for_input", last_message=data.message)
+            session = sessions.create_or_update(
+                data.session_id, status="waiting_for_input", last_message=data.message
+            )
             await bot.notify_session_idle(session)
 
     elif data.event == "Stop":
-        session.update(status="waiting_for_input", last_message=data.message)
+        session = sessions.create_or_update(
+            data.session_id, status="waiting_for_input", last_message=data.message
+        )
         await bot.notify_session_idle(session)
 
     elif data.event == "SessionEnd":
-        session.update(status="ended")
+        session = sessions.create_or_update(data.session_id, status="ended")
         await bot.notify_session_end(session)
         # Remove session (also clears allow-all status)
-        await sessions.remove(data.session_id)
+        sessions.remove(data.session_id)
+
+
+@app.post("/telegram")
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: str | None = Header(default=None),
+):
+    """Receive Telegram updates when TELEGRAM_WEBHOOK_URL is configured."""
+    if not settings.telegram_webhook_url:
+        raise HTTPException(status_code=404)
+    # Only Telegram knows the secret registered with set_webhook. Compare
+    # bytes: compare_digest rejects non-ASCII str, and header values arrive
+    # decoded as Latin-1.
+    received = (x_telegram_bot_api_secret_token or "").encode("latin-1")
+    if not hmac.compare_digest(received, settings.telegram_webhook_secret.encode()):
+        raise HTTPException(status_code=403)
 
+    try:
+        data = await request.json()
+        if not isinstance(data, dict):
+            raise ValueError("update is not a JSON object")
+        await bot.process_webhook_update(data)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.warning(f"Malformed webhook update: {e}")
+        raise HTTPException(status_code=400)
     return {"status": "ok"}
 
 
@@ -158,14 +221,12 @@ async def request_permission(data: PermissionRequestInput) -> PermissionResponse
 
     # Wait for response with timeout
     try:
-        await asyncio.wait_for(
-            request.event.wait(),
-            timeout=settings.permission_timeout,
-        )
+        async with asyncio.timeout(settings.permission_timeout):
+            await request.event.wait()
         decision = request.decision or "deny"
         reason = request.reason
         logger.info(f"Permission {decision} for {request_id}")
-    except asyncio.TimeoutError:
+    except TimeoutError:
         decision = "deny"
         reason = "Timeout - no response received"
         logger.warning(f"Permission timeout for {request_id}")
@@ -174,7 +235,12 @@ async def request_permission(data: PermissionRequestInput) -> PermissionResponse
         if request.message_id:
             await bot.update_message(
                 request.message_id,
-                f"⏰ *Timeout*\n\n*Tool:* `{request.tool}`\n*Command:* `{request.command[:100]}...`",
+                DECISION_TEMPLATE.format(
+                    emoji="⏰",
+                    status="Timeout",
+                    tool=request.tool,
+                    command=truncate(request.command, 100),
+                ),
             )
     finally:
         state.remove(request_id)
@@ -196,6 +262,8 @@ def main():
         app,
         host=settings.bridge_host,
         port=settings.bridge_port,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
         log_level="info",
     )
 
@@ -4,9 +4,11 @@ import asyncio
 import logging
 import os
 import shutil
+import stat
 import subprocess
-from dataclasses import dataclass, field
-from datetime import datetime
+import sys
+import time
+from dataclasses import dataclass, field, fields
 from pathlib import Path
 from typing import Dict, Optional
 
@@ -27,16 +29,145 @@ def find_tmux() -> Optional[str]:
         "/usr/bin/tmux",            # Linux package manager
     ]
     for path in common_paths:
-        if os.path.isfile(path) and os.access(path, os.X_OK):
+        # One stat per candidate instead of isfile() + access()
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode) and st.st_mode & 0o111:
             return path
 
     return None
 
 
 TMUX_PATH = find_tmux()
+HOME_DIR = str(Path.home())
+
+STATUS_EMOJI = {
+    "processing": "⚙️",
+    "waiting_for_input": "💬",
+    "running_tool": "🔧",
+    "ended": "✅",
+    "compacting": "📦",
+}
+
+# Writes argv[2] to the iTerm2 session whose tty contains argv[1]. The text
+# is passed as an argument so it never needs escaping into the script.
+ITERM_WRITE_SCRIPT = '''
+on run argv
+    set ttyName to item 1 of argv
+    set inputText to item 2 of argv
+    tell application "iTerm2"
+        repeat with w in windows
+            repeat with t in tabs of w
+                repeat with s in sessions of t
+                    if tty of s contains ttyName then
+                        tell s
+                            write text inputText newline yes
+                        end tell
+                        return "ok"
+                    end if
+                end repeat
+            end repeat
+        end repeat
+        return "not found"
+    end tell
+end run
+'''
+
+
+def display_path(cwd: Optional[str]) -> str:
+    """Shorten a directory for display, replacing the home dir with ~."""
+    if not cwd:
+        return "unknown"
+    if HOME_DIR and cwd.startswith(HOME_DIR):
+        return "~" + cwd[len(HOME_DIR):]
+    return cwd
+
+
+async def run_command(args: list[str], timeout: float) -> subprocess.CompletedProcess:
+    """Run a command without blocking the event loop.
+
+    Mirrors subprocess.run(capture_output=True, text=True, timeout=...).
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        async with asyncio.timeout(timeout):
+            stdout, stderr = await proc.communicate()
+    except TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(args, timeout)
+    return subprocess.CompletedProcess(
+        args, proc.returncode, stdout.decode(), stderr.decode()
+    )
+
+
+# tmux pane ids found by TTY, reused until sending to them fails
+_tmux_targets: Dict[str, str] = {}
+
+
+async def find_tmux_target(tty: str) -> Optional[str]:
+    """Find the tmux pane for a TTY, falling back to a session named "claude".
+
+    Returns a pane id (e.g. "%3"), which tmux never reuses while the server
+    is running, so it is safe to cache.
+    """
+    result = await run_command(
+        [TMUX_PATH, 'list-panes', '-a', '-F',
+         '#{pane_tty} #{pane_id} #{session_name}:#{window_index}.#{pane_index}'],
+        timeout=5
+    )
+    if result.returncode != 0:
+        return None
 
-
-@dataclass
+    # One pass: map pane TTYs to panes and remember the first pane of a
+    # session named "claude" as a fallback
+    panes: Dict[str, str] = {}
+    claude_pane = claude_target = None
+    for line in result.stdout.splitlines():
+        parts = line.split(' ', 2)
+        if len(parts) != 3:
+            continue
+        pane_tty, pane_id, target = parts
+        panes.setdefault(pane_tty, pane_id)
+        if claude_pane is None and target.startswith('claude:'):
+            claude_pane = pane_id
+            claude_target = target
+
+    pane_id = panes.get(tty)
+    if pane_id:
+        _tmux_targets[tty] = pane_id
+        return pane_id
+
+    # If not found by TTY, use the session named "claude"
+    if claude_pane:
+        logger.info(f"Using tmux session 'claude': {claude_target}")
+    return claude_pane
+
+
+async def send_tmux_keys(tmux_target: str, text: str) -> bool:
+    """Type text into a tmux pane and press Enter."""
+    # tmux splits commands on a trailing ';', so escape it
+    literal = text[:-1] + '\\;' if text.endswith(';') else text
+    # Send text and Enter as two commands in one tmux call
+    result = await run_command(
+        [TMUX_PATH, 'send-keys', '-t', tmux_target, '-l', literal,
+         ';', 'send-keys', '-t', tmux_target, 'Enter'],
+        timeout=10
+    )
+    if result.returncode == 0:
+        logger.info(f"Sent input via tmux to {tmux_target}: {text[:50]}...")
+        return True
+    logger.warning(f"tmux send-keys failed: {result.stderr}")
+    return False
+
+
+@dataclass(slots=True)
 class Session:
     """Represents an active Claude Code session."""
 
@@ -47,17 +178,32 @@ class Session:
     status: str = "unknown"  # processing, waiting_for_input, running_tool, ended
     last_message: Optional[str] = None
     last_tool: Optional[str] = None
-    created_at: datetime = field(default_factory=datetime.now)
-    updated_at: datetime = field(default_factory=datetime.now)
+    # Epoch seconds; convert with datetime.fromtimestamp() for display
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # Display strings, derived from session_id and cwd
+    short_id: str = field(init=False)
+    display_cwd: str = field(init=False)
+
+    def __post_init__(self):
+        self.short_id = self.session_id[:8]
+        self.display_cwd = display_path(self.cwd)
 
     def update(self, **kwargs):
-        """Update session fields."""
+        """Update session fields.
+
+        Use SessionManager.create_or_update() for status changes so the
+        manager's indexes stay in sync.
+        """
+        old_cwd = self.cwd
         for key, value in kwargs.items():
-            if hasattr(self, key) and value is not None:
+            if value is not None and key in _SESSION_FIELDS:
                 setattr(self, key, value)
-        self.updated_at = datetime.now()
+        if self.cwd != old_cwd:
+            self.display_cwd = display_path(self.cwd)
+        self.updated_at = time.time()
 
-    def send_input(self, text: str) -> bool:
+    async def send_input(self, text: str) -> bool:
         """Send input text to the session.
 
         Tries multiple methods:
@@ -73,56 +219,18 @@ class Session:
             logger.debug("tmux not found, skipping tmux method")
         else:
             try:
-                # First try to find pane by TTY
-                result = subprocess.run(
-                    [TMUX_PATH, 'list-panes', '-a', '-F', '#{pane_tty} #{session_name}:#{window_index}.#{pane_index}'],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-
-                tmux_target = None
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n'):
-                        if line and self.tty and self.tty in line:
-                            parts = line.split(' ', 1)
-                            if len(parts) == 2:
-                                tmux_target = parts[1]
-                                break
-
-                    # If not found by TTY, look for session named "claude"
-                    if not tmux_target:
-                        for line in result.stdout.strip().split('\n'):
-                            if line and 'claude:' in line:
-                                parts = line.split(' ', 1)
-                                if len(parts) == 2:
-                                    tmux_target = parts[1]
-                                    logger.info(f"Using tmux session 'claude': {tmux_target}")
-                                    break
-
-                    if tmux_target:
-                        # Send text first
-                        send_result = subprocess.run(
-                            [TMUX_PATH, 'send-keys', '-t', tmux_target, '-l', text],
-                            capture_output=True,
-                            text=True,
-                            timeout=10
-                        )
-                        if send_result.returncode != 0:
-                            logger.warning(f"tmux send-keys text failed: {send_result.stderr}")
-
-                        # Then send Enter separately
-                        enter_result = subprocess.run(
-                            [TMUX_PATH, 'send-keys', '-t', tmux_target, 'Enter'],
-                            capture_output=True,
-                            text=True,
-                            timeout=10
-                        )
-                        if send_result.returncode == 0 and enter_result.returncode == 0:
-                            logger.info(f"Sent input via tmux to {tmux_target}: {text[:50]}...")
-                            return True
-                        else:
-                            logger.warning(f"tmux send Enter failed: {enter_result.stderr}")
+                # Reuse the pane found for this TTY last time
+                cached = _tmux_targets.get(self.tty)
+                if cached:
+                    if await send_tmux_keys(cached, text):
+                        return True
+                    # Pane is gone or moved; forget it and look it up again
+                    _tmux_targets.pop(self.tty, None)
+
+                tmux_target = await find_tmux_target(self.tty)
+                if tmux_target and tmux_target != cached:
+                    if await send_tmux_keys(tmux_target, text):
+                        return True
             except FileNotFoundError:
                 logger.debug("tmux not found, trying iTerm2")
             except Exception as e:
@@ -131,30 +239,9 @@ class Session:
         # Method 2: iTerm2 write text (text appears but doesn't submit in Claude Code)
         try:
             tty_name = self.tty.replace("/dev/", "")
-            escaped_text = text.replace('\\', '\\\\').replace('"', '\\"')
-
-            iterm_script = f'''
-            tell application "iTerm2"
-                repeat with w in windows
-                    repeat with t in tabs of w
-                        repeat with s in sessions of t
-                            if tty of s contains "{tty_name}" then
-                                tell s
-                                    write text "{escaped_text}" newline yes
-                                end tell
-                                return "ok"
-                            end if
-                        end repeat
-                    end repeat
-                end repeat
-                return "not found"
-            end tell
-            '''
-
-            result = subprocess.run(
-                ['osascript', '-e', iterm_script],
-                capture_output=True,
-                text=True,
+
+            result = await run_command(
+                ['osascript', '-e', ITERM_WRITE_SCRIPT, tty_name, text],
                 timeout=15
             )
 
@@ -170,27 +257,14 @@ class Session:
             logger.error(f"Failed to send input: {e}")
             return False
 
-    @property
-    def display_cwd(self) -> str:
-        """Get shortened cwd for display."""
-        if not self.cwd:
-            return "unknown"
-        # Replace home dir with ~
-        home = str(Path.home())
-        if home and self.cwd.startswith(home):
-            return "~" + self.cwd[len(home):]
-        return self.cwd
-
     @property
     def status_emoji(self) -> str:
         """Get emoji for current status."""
-        return {
-            "processing": "⚙️",
-            "waiting_for_input": "💬",
-            "running_tool": "🔧",
-            "ended": "✅",
-            "compacting": "📦",
-        }.get(self.status, "❓")
+        return STATUS_EMOJI.get(self.status, "❓")
+
+
+# Fields update() may set; the derived display fields are kept in sync by it
+_SESSION_FIELDS = frozenset(f.name for f in fields(Session) if f.init)
 
 
 class SessionManager:
@@ -198,7 +272,10 @@ class SessionManager:
 
     def __init__(self):
         self._sessions: Dict[str, Session] = {}
-        self._lock = asyncio.Lock()
+        self._by_tty: Dict[str, Session] = {}
+        # Status indexes, kept in sync by create_or_update()
+        self._active: Dict[str, Session] = {}
+        self._waiting: Dict[str, Session] = {}
         self._allowed_sessions: set[str] = set()  # Sessions with "Allow All" enabled
 
     def get(self, session_id: str) -> Optional[Session]:
@@ -207,31 +284,49 @@ class SessionManager:
 
     def get_by_tty(self, tty: str) -> Optional[Session]:
         """Get a session by TTY."""
-        for session in self._sessions.values():
-            if session.tty == tty:
-                return session
-        return None
+        return self._by_tty.get(tty)
 
-    async def create_or_update(self, session_id: str, **kwargs) -> Session:
+    def create_or_update(self, session_id: str, **kwargs) -> Session:
         """Create a new session or update existing one."""
-        async with self._lock:
-            if session_id in self._sessions:
-                session = self._sessions[session_id]
-                session.update(**kwargs)
-            else:
-                session = Session(session_id=session_id, **kwargs)
-                self._sessions[session_id] = session
-                logger.info(f"New session: {session_id}")
-            return session
-
-    async def remove(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            session = self._sessions[session_id]
+            old_tty = session.tty
+            session.update(**kwargs)
+            if old_tty != session.tty and self._by_tty.get(old_tty) is session:
+                del self._by_tty[old_tty]
+        else:
+            session_id = sys.intern(session_id)
+            session = Session(session_id=session_id, **kwargs)
+            self._sessions[session_id] = session
+            logger.info(f"New session: {session_id}")
+        self._index(session)
+        return session
+
+    def remove(self, session_id: str) -> None:
         """Remove a session."""
-        async with self._lock:
-            if session_id in self._sessions:
-                del self._sessions[session_id]
-                logger.info(f"Session removed: {session_id}")
-            # Also remove from allowed sessions
-            self._allowed_sessions.discard(session_id)
+        session = self._sessions.pop(session_id, None)
+        if session:
+            if session.tty and self._by_tty.get(session.tty) is session:
+                del self._by_tty[session.tty]
+            self._active.pop(session_id, None)
+            self._waiting.pop(session_id, None)
+            logger.info(f"Session removed: {session_id}")
+        # Also remove from allowed sessions
+        self._allowed_sessions.discard(session_id)
+
+    def _index(self, session: Session) -> None:
+        """Refresh the TTY and status indexes for a session."""
+        session_id = session.session_id
+        if session.tty:
+            self._by_tty[session.tty] = session
+        if session.status != "ended":
+            self._active.setdefault(session_id, session)
+        else:
+            self._active.pop(session_id, None)
+        if session.status == "waiting_for_input":
+            self._waiting.setdefault(session_id, session)
+        else:
+            self._waiting.pop(session_id, None)
 
     def allow_session(self, session_id: str) -> None:
         """Mark a session as allowed for all future requests."""
@@ -248,15 +343,15 @@ class SessionManager:
 
     def active(self) -> list[Session]:
         """Get sessions that are not ended."""
-        return [s for s in self._sessions.values() if s.status != "ended"]
+        return list(self._active.values())
 
     def waiting_for_input(self) -> list[Session]:
         """Get sessions waiting for user input."""
-        return [s for s in self._sessions.values() if s.status == "waiting_for_input"]
+        return list(self._waiting.values())
 
     def count(self) -> int:
         """Count active sessions."""
-        return len(self.active())
+        return len(self._active)
 
 
 # Global session manager instance
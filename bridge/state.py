@@ -1,11 +1,12 @@
 """State management for pending permission requests."""
 
 import asyncio
+import sys
 from dataclasses import dataclass, field
 from typing import Literal
 
 
-@dataclass
+@dataclass(slots=True)
 class PendingRequest:
     """A pending permission request waiting for user response."""
 
@@ -27,12 +28,27 @@ class StateManager:
 
     def add(self, request: PendingRequest) -> None:
         """Add a pending request."""
+        request.request_id = sys.intern(request.request_id)
         self._pending[request.request_id] = request
 
     def get(self, request_id: str) -> PendingRequest | None:
         """Get a pending request by ID."""
         return self._pending.get(request_id)
 
+    def resolve(
+        self,
+        request_id: str,
+        decision: Literal["allow", "deny"],
+        reason: str | None = None,
+    ) -> PendingRequest | None:
+        """Record a decision and wake the coroutine waiting on it."""
+        request = self._pending.get(request_id)
+        if request:
+            request.decision = decision
+            request.reason = reason
+            request.event.set()
+        return request
+
     def remove(self, request_id: str) -> PendingRequest | None:
         """Remove and return a pending request."""
         return self._pending.pop(request_id, None)
@@ -1,7 +1,13 @@
 """Telegram bot for permission approvals and session management."""
 
+import asyncio
 import logging
+import sys
+import time
+from typing import Callable
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -17,20 +23,94 @@ from .sessions import sessions, Session
 
 logger = logging.getLogger(__name__)
 
+ALLOW_LABEL = "✅ Allow"
+DENY_LABEL = "❌ Deny"
+ALLOW_SESSION_LABEL = "✅ Allow All Session"
+
+PERMISSION_TEMPLATE = (
+    "🔐 *Permission Request*\n\n"
+    "*Tool:* `{tool}`\n"
+    "*Command:*\n```\n{command}\n```"
+)
+DECISION_TEMPLATE = "{emoji} *{status}*\n\n*Tool:* `{tool}`\n*Command:* `{command}`"
+SESSION_START_TEMPLATE = "🆕 *New Session*\n\n📁 `{cwd}`\n🔑 `{short_id}...`"
+SESSION_END_TEMPLATE = "✅ *Session ended*\n\n📁 `{cwd}`"
+
+# Permission button action -> (decision, reason, emoji, status)
+PERMISSION_ACTIONS = {
+    "allow": ("allow", None, "✅", "Allowed"),
+    "allow_session": ("allow", None, "✅", "Allowed (all session)"),
+    "deny": ("deny", "Denied via Telegram", "❌", "Denied"),
+}
+
+# The only update types the handlers consume
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+# getUpdates long-poll duration in seconds; Telegram answers as soon as an
+# update arrives, so a long poll only cuts idle requests
+POLL_TIMEOUT = 50
+
+# Reply mode ends on its own if no message follows within this many seconds
+REPLY_MODE_TTL = settings.permission_timeout
+
+# Idle notifications within this many seconds edit the previous message
+IDLE_EDIT_WINDOW = 2.0
+# Session notifications allowed in flight to the Bot API at once
+NOTIFY_CONCURRENCY = 8
+
+
+def truncate(text: str, limit: int) -> str:
+    """Shorten text to limit characters, marking the cut with '...'."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def permission_keyboard(request_id: str) -> InlineKeyboardMarkup:
+    """Build the Allow / Deny / Allow All Session buttons for a request."""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(ALLOW_LABEL, callback_data=f"allow:{request_id}"),
+            InlineKeyboardButton(DENY_LABEL, callback_data=f"deny:{request_id}"),
+        ],
+        [
+            InlineKeyboardButton(
+                ALLOW_SESSION_LABEL, callback_data=f"allow_session:{request_id}"
+            ),
+        ],
+    ])
 
-def authorized_only(func):
-    """Decorator to restrict handlers to authorized chat_id only."""
-    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        chat_id = update.effective_chat.id if update.effective_chat else None
-        if chat_id != settings.telegram_chat_id:
-            logger.warning(f"Unauthorized access attempt from chat_id: {chat_id}")
-            if update.message:
-                await update.message.reply_text("⛔ Unauthorized. This bot is private.")
-            elif update.callback_query:
-                await update.callback_query.answer("⛔ Unauthorized", show_alert=True)
-            return
-        return await func(self, update, context)
-    return wrapper
+
+class AuthorizedCallbackQueryHandler(CallbackQueryHandler):
+    """CallbackQueryHandler that ignores button presses from other chats.
+
+    CallbackQueryHandler takes no filters, so the chat check lives here and
+    PTB drops the update before scheduling the callback.
+    """
+
+    __slots__ = ("chat_id",)
+
+    def __init__(self, callback, chat_id: int):
+        super().__init__(callback)
+        self.chat_id = chat_id
+
+    def check_update(self, update: object):
+        if not isinstance(update, Update):
+            return None
+        chat = update.effective_chat
+        if chat is None or chat.id != self.chat_id:
+            return None
+        return super().check_update(update)
+
+
+class ReplyModeFilter(filters.MessageFilter):
+    """Matches messages from chats that tapped Reply on a session."""
+
+    __slots__ = ("lookup",)
+
+    def __init__(self, lookup: Callable[[int], str | None]):
+        super().__init__(name="ReplyModeFilter")
+        self.lookup = lookup
+
+    def filter(self, message) -> bool:
+        return self.lookup(message.chat.id) is not None
 
 
 class TelegramBot:
@@ -39,36 +119,67 @@ class TelegramBot:
     def __init__(self):
         self.app: Application | None = None
         self._initialized = False
-        # Track which session each user is replying to
-        self._reply_targets: dict[int, str] = {}  # chat_id -> session_id
+        # Track which session each user is replying to:
+        # chat_id -> (session_id, expires at)
+        self._reply_targets: dict[int, tuple[str, float]] = {}
+        # Last idle notification per session: session_id -> (message_id, sent at)
+        self._idle_messages: dict[str, tuple[int, float]] = {}
+        self._idle_locks: dict[str, asyncio.Lock] = {}
+        # Caps concurrent session notifications; permission messages bypass it
+        self._notify_semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
 
     async def initialize(self) -> None:
         """Initialize the Telegram bot application."""
         if self._initialized:
             return
 
-        self.app = (
-            Application.builder()
-            .token(settings.telegram_bot_token)
-            .build()
-        )
+        webhook_url = settings.telegram_webhook_url
+        if webhook_url and not settings.telegram_webhook_secret:
+            raise RuntimeError(
+                "TELEGRAM_WEBHOOK_SECRET is required when TELEGRAM_WEBHOOK_URL is set"
+            )
 
-        # Register handlers
-        self.app.add_handler(CommandHandler("start", self._cmd_start))
-        self.app.add_handler(CommandHandler("status", self._cmd_status))
-        self.app.add_handler(CommandHandler("pending", self._cmd_pending))
-        self.app.add_handler(CommandHandler("sessions", self._cmd_sessions))
-        self.app.add_handler(CommandHandler("cancel", self._cmd_cancel))
-        self.app.add_handler(CallbackQueryHandler(self._handle_callback))
-        # Handle text messages for session replies
+        builder = Application.builder().token(settings.telegram_bot_token)
+        if webhook_url:
+            # Updates arrive through the daemon's /telegram endpoint instead
+            builder = builder.updater(None)
+        self.app = builder.build()
+
+        # Register handlers; updates from any other chat are dropped by PTB
+        authorized = filters.Chat(chat_id=settings.telegram_chat_id)
+        self.app.add_handler(CommandHandler("start", self._cmd_start, filters=authorized))
+        self.app.add_handler(CommandHandler("status", self._cmd_status, filters=authorized))
+        self.app.add_handler(CommandHandler("pending", self._cmd_pending, filters=authorized))
+        self.app.add_handler(CommandHandler("sessions", self._cmd_sessions, filters=authorized))
+        self.app.add_handler(CommandHandler("cancel", self._cmd_cancel, filters=authorized))
+        self.app.add_handler(AuthorizedCallbackQueryHandler(
+            self._handle_callback, settings.telegram_chat_id
+        ))
+        # Handle text messages for session replies. Both handlers share a
+        # group, so only the first match runs: replies go to the session,
+        # anything else gets the hint.
+        text = authorized & filters.TEXT & ~filters.COMMAND
         self.app.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND,
+            text & ReplyModeFilter(self._reply_target),
             self._handle_text_message
         ))
+        self.app.add_handler(MessageHandler(text, self._send_reply_hint))
 
         await self.app.initialize()
         await self.app.start()
-        await self.app.updater.start_polling(drop_pending_updates=True)
+        if webhook_url:
+            await self.app.bot.set_webhook(
+                webhook_url,
+                allowed_updates=ALLOWED_UPDATES,
+                drop_pending_updates=True,
+                secret_token=settings.telegram_webhook_secret,
+            )
+        else:
+            await self.app.updater.start_polling(
+                drop_pending_updates=True,
+                allowed_updates=ALLOWED_UPDATES,
+                timeout=POLL_TIMEOUT,
+            )
 
         self._initialized = True
         logger.info("Telegram bot started")
@@ -76,44 +187,37 @@ class TelegramBot:
     async def shutdown(self) -> None:
         """Shutdown the bot gracefully."""
         if self.app and self._initialized:
-            await self.app.updater.stop()
+            if self.app.updater:
+                await self.app.updater.stop()
             await self.app.stop()
             await self.app.shutdown()
             self._initialized = False
             logger.info("Telegram bot stopped")
 
+    async def process_webhook_update(self, data: dict) -> None:
+        """Queue an update delivered to the webhook for the handlers."""
+        if not self.app:
+            return
+        await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+
+    def _reply_target(self, chat_id: int) -> str | None:
+        """Get the session a chat is replying to, dropping it once expired."""
+        target = self._reply_targets.get(chat_id)
+        if target is None:
+            return None
+        if target[1] <= time.monotonic():
+            del self._reply_targets[chat_id]
+            return None
+        return target[0]
+
     async def send_permission_request(self, request: PendingRequest) -> int | None:
         """Send a permission request message with buttons."""
         if not self.app:
             logger.error("Bot not initialized")
             return None
 
-        keyboard = [
-            [
-                InlineKeyboardButton(
-                    "✅ Allow", callback_data=f"allow:{request.request_id}"
-                ),
-                InlineKeyboardButton(
-                    "❌ Deny", callback_data=f"deny:{request.request_id}"
-                ),
-            ],
-            [
-                InlineKeyboardButton(
-                    "✅ Allow All Session",
-                    callback_data=f"allow_session:{request.request_id}",
-                ),
-            ],
-        ]
-
-        # Truncate long commands for display
-        command_display = request.command
-        if len(command_display) > 500:
-            command_display = command_display[:500] + "..."
-
-        text = (
-            f"🔐 *Permission Request*\n\n"
-            f"*Tool:* `{request.tool}`\n"
-            f"*Command:*\n```\n{command_display}\n```"
+        text = PERMISSION_TEMPLATE.format(
+            tool=request.tool, command=truncate(request.command, 500)
         )
 
         if request.session_id:
@@ -123,7 +227,7 @@ class TelegramBot:
             message = await self.app.bot.send_message(
                 chat_id=settings.telegram_chat_id,
                 text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                reply_markup=permission_keyboard(request.request_id),
                 parse_mode="Markdown",
             )
             return message.message_id
@@ -146,7 +250,6 @@ class TelegramBot:
         except Exception as e:
             logger.error(f"Failed to update message: {e}")
 
-    @authorized_only
     async def _cmd_start(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
@@ -162,7 +265,6 @@ class TelegramBot:
             parse_mode="Markdown",
         )
 
-    @authorized_only
     async def _cmd_status(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
@@ -179,7 +281,6 @@ class TelegramBot:
             parse_mode="Markdown",
         )
 
-    @authorized_only
     async def _cmd_pending(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
@@ -190,14 +291,12 @@ class TelegramBot:
             await update.message.reply_text("No pending requests.")
             return
 
-        text = "*Pending Requests:*\n\n"
+        lines = ["*Pending Requests:*\n"]
         for req in pending:
-            cmd_short = req.command[:50] + "..." if len(req.command) > 50 else req.command
-            text += f"• `{req.tool}`: `{cmd_short}`\n"
+            lines.append(f"• `{req.tool}`: `{truncate(req.command, 50)}`")
 
-        await update.message.reply_text(text, parse_mode="Markdown")
+        await update.message.reply_text("\n".join(lines) + "\n", parse_mode="Markdown")
 
-    @authorized_only
     async def _cmd_sessions(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
@@ -208,45 +307,37 @@ class TelegramBot:
             await update.message.reply_text("No active sessions.")
             return
 
-        text = "*Active Sessions:*\n\n"
+        lines = ["*Active Sessions:*\n"]
         for s in active:
-            text += f"{s.status_emoji} `{s.session_id[:8]}...`\n"
-            text += f"   📁 {s.display_cwd}\n"
+            lines.append(f"{s.status_emoji} `{s.short_id}...`")
+            lines.append(f"   📁 {s.display_cwd}")
             if s.status == "waiting_for_input" and s.last_message:
-                msg_short = s.last_message[:100] + "..." if len(s.last_message) > 100 else s.last_message
-                text += f"   💬 _{msg_short}_\n"
-            text += "\n"
+                lines.append(f"   💬 _{truncate(s.last_message, 100)}_")
+            lines.append("")
 
-        await update.message.reply_text(text, parse_mode="Markdown")
+        await update.message.reply_text("\n".join(lines) + "\n", parse_mode="Markdown")
 
-    @authorized_only
     async def _cmd_cancel(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
         """Handle /cancel command - cancel reply mode."""
         chat_id = update.effective_chat.id
-        if chat_id in self._reply_targets:
+        if self._reply_target(chat_id):
             del self._reply_targets[chat_id]
             await update.message.reply_text("✅ Reply mode cancelled.")
         else:
             await update.message.reply_text("No active reply mode.")
 
-    @authorized_only
     async def _handle_text_message(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
-        """Handle text messages - send to target session if in reply mode."""
+        """Handle text messages in reply mode - send to the target session."""
         chat_id = update.effective_chat.id
-
-        if chat_id not in self._reply_targets:
-            await update.message.reply_text(
-                "💡 To send a message to a session, tap the *Reply* button "
-                "on a session notification first.",
-                parse_mode="Markdown"
-            )
+        session_id = self._reply_target(chat_id)
+        if session_id is None:
+            # Reply mode was cancelled or expired after the filter matched
             return
 
-        session_id = self._reply_targets[chat_id]
         session = sessions.get(session_id)
 
         if not session:
@@ -255,13 +346,13 @@ class TelegramBot:
             return
 
         text = update.message.text
-        success = session.send_input(text)
+        success = await session.send_input(text)
 
         if success:
             # Clear reply target after sending
-            del self._reply_targets[chat_id]
+            self._reply_targets.pop(chat_id, None)
             await update.message.reply_text(
-                f"✅ Sent to session `{session_id[:8]}...`\n\n"
+                f"✅ Sent to session `{session.short_id}...`\n\n"
                 f"```\n{text[:200]}\n```",
                 parse_mode="Markdown"
             )
@@ -270,25 +361,34 @@ class TelegramBot:
                 f"❌ Failed to send to session. TTY may be closed."
             )
 
+    async def _send_reply_hint(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        """Handle text messages outside reply mode."""
+        await update.message.reply_text(
+            "💡 To send a message to a session, tap the *Reply* button "
+            "on a session notification first.",
+            parse_mode="Markdown"
+        )
+
     async def notify_session_start(self, session: Session) -> None:
         """Notify about a new session starting."""
         if not self.app:
             return
 
-        text = (
-            f"🆕 *New Session*\n\n"
-            f"📁 `{session.display_cwd}`\n"
-            f"🔑 `{session.session_id[:8]}...`"
+        text = SESSION_START_TEMPLATE.format(
+            cwd=session.display_cwd, short_id=session.short_id
         )
 
-        try:
-            await self.app.bot.send_message(
-                chat_id=settings.telegram_chat_id,
-                text=text,
-                parse_mode="Markdown",
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify session start: {e}")
+        async with self._notify_semaphore:
+            try:
+                await self.app.bot.send_message(
+                    chat_id=settings.telegram_chat_id,
+                    text=text,
+                    parse_mode="Markdown",
+                )
+            except Exception as e:
+                logger.error(f"Failed to notify session start: {e}")
 
     async def notify_session_idle(self, session: Session) -> None:
         """Notify that a session is waiting for input."""
@@ -302,10 +402,7 @@ class TelegramBot:
             ),
         ]]
 
-        # Truncate message for display
-        msg_display = session.last_message or "No message"
-        if len(msg_display) > 500:
-            msg_display = msg_display[:500] + "..."
+        msg_display = truncate(session.last_message or "No message", 500)
 
         text = (
             f"💬 *Session waiting for input*\n\n"
@@ -313,36 +410,62 @@ class TelegramBot:
             f"*Claude:*\n{msg_display}"
         )
 
-        try:
-            await self.app.bot.send_message(
-                chat_id=settings.telegram_chat_id,
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="Markdown",
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify session idle: {e}")
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        # One idle notification per session at a time, so a burst can't
+        # send several messages before the first is recorded
+        idle_lock = self._idle_locks.setdefault(session.session_id, asyncio.Lock())
+        async with idle_lock, self._notify_semaphore:
+            now = time.monotonic()
+            # Fold a burst of idle notifications into the message just sent
+            previous = self._idle_messages.get(session.session_id)
+            if previous and now - previous[1] < IDLE_EDIT_WINDOW:
+                try:
+                    await self.app.bot.edit_message_text(
+                        chat_id=settings.telegram_chat_id,
+                        message_id=previous[0],
+                        text=text,
+                        reply_markup=reply_markup,
+                        parse_mode="Markdown",
+                    )
+                    return
+                except BadRequest as e:
+                    if "not modified" in str(e):
+                        return
+                    logger.warning(f"Failed to edit idle notification, sending new one: {e}")
+                except Exception as e:
+                    logger.warning(f"Failed to edit idle notification, sending new one: {e}")
+
+            try:
+                message = await self.app.bot.send_message(
+                    chat_id=settings.telegram_chat_id,
+                    text=text,
+                    reply_markup=reply_markup,
+                    parse_mode="Markdown",
+                )
+                self._idle_messages[session.session_id] = (message.message_id, now)
+            except Exception as e:
+                logger.error(f"Failed to notify session idle: {e}")
 
     async def notify_session_end(self, session: Session) -> None:
         """Notify that a session has ended."""
+        self._idle_messages.pop(session.session_id, None)
+        self._idle_locks.pop(session.session_id, None)
         if not self.app:
             return
 
-        text = (
-            f"✅ *Session ended*\n\n"
-            f"📁 `{session.display_cwd}`"
-        )
+        text = SESSION_END_TEMPLATE.format(cwd=session.display_cwd)
 
-        try:
-            await self.app.bot.send_message(
-                chat_id=settings.telegram_chat_id,
-                text=text,
-                parse_mode="Markdown",
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify session end: {e}")
+        async with self._notify_semaphore:
+            try:
+                await self.app.bot.send_message(
+                    chat_id=settings.telegram_chat_id,
+                    text=text,
+                    parse_mode="Markdown",
+                )
+            except Exception as e:
+                logger.error(f"Failed to notify session end: {e}")
 
-    @authorized_only
     async def _handle_callback(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> None:
@@ -355,61 +478,60 @@ class TelegramBot:
             return
 
         action, target_id = data.split(":", 1)
+        # Stored ids are interned, so lookups can match by identity
+        target_id = sys.intern(target_id)
 
-        # Handle session reply action
         if action == "reply":
-            session = sessions.get(target_id)
-            if not session:
-                await query.edit_message_text("⚠️ Session no longer exists.")
-                return
-
-            chat_id = update.effective_chat.id
-            self._reply_targets[chat_id] = target_id
-
-            await query.edit_message_text(
-                f"📝 *Reply mode active*\n\n"
-                f"📁 `{session.display_cwd}`\n\n"
-                f"Type your message and I'll send it to this session.\n"
-                f"Use /cancel to exit reply mode.",
-                parse_mode="Markdown",
-            )
+            await self._start_reply_mode(update, target_id)
+        elif action in PERMISSION_ACTIONS:
+            await self._resolve_permission(update, action, target_id)
+
+    async def _start_reply_mode(self, update: Update, session_id: str) -> None:
+        """Route the chat's next text message to a session."""
+        query = update.callback_query
+        session = sessions.get(session_id)
+        if not session:
+            await query.edit_message_text("⚠️ Session no longer exists.")
             return
 
-        # Handle permission actions
-        request = state.get(target_id)
+        chat_id = update.effective_chat.id
+        self._reply_targets[chat_id] = (
+            session_id, time.monotonic() + REPLY_MODE_TTL
+        )
+
+        await query.edit_message_text(
+            f"📝 *Reply mode active*\n\n"
+            f"📁 `{session.display_cwd}`\n\n"
+            f"Type your message and I'll send it to this session.\n"
+            f"Use /cancel to exit reply mode.",
+            parse_mode="Markdown",
+        )
+
+    async def _resolve_permission(
+        self, update: Update, action: str, request_id: str
+    ) -> None:
+        """Apply an Allow / Deny / Allow All Session button press."""
+        query = update.callback_query
+        request = state.get(request_id)
         if not request:
             await query.edit_message_text("⚠️ Request expired or already handled.")
             return
 
-        if action == "allow_session":
+        decision, reason, emoji, status = PERMISSION_ACTIONS[action]
+        if action == "allow_session" and request.session_id:
             # Mark session for allow-all future requests
-            if request.session_id:
-                sessions.allow_session(request.session_id)
-            request.decision = "allow"
-            emoji = "✅"
-            status = "Allowed (all session)"
-        elif action == "allow":
-            request.decision = "allow"
-            emoji = "✅"
-            status = "Allowed"
-        else:
-            request.decision = "deny"
-            request.reason = "Denied via Telegram"
-            emoji = "❌"
-            status = "Denied"
-
-        # Truncate command for final message
-        cmd_short = request.command[:100] + "..." if len(request.command) > 100 else request.command
+            sessions.allow_session(request.session_id)
+        state.resolve(request_id, decision, reason)
 
         await query.edit_message_text(
-            f"{emoji} *{status}*\n\n"
-            f"*Tool:* `{request.tool}`\n"
-            f"*Command:* `{cmd_short}`",
+            DECISION_TEMPLATE.format(
+                emoji=emoji,
+                status=status,
+                tool=request.tool,
+                command=truncate(request.command, 100),
+            ),
             parse_mode="Markdown",
         )
 
-        # Signal the waiting coroutine
-        request.event.set()
-
 
 bot = TelegramBot()
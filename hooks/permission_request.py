@@ -7,28 +7,59 @@ a tool. It sends the request to the bridge daemon and waits for user
 approval via Telegram.
 """
 
+import http.client
 import json
 import os
 import sys
 import uuid
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit
+
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:  # stdlib fallback; hooks run under the system python3
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    loads = json.loads
 
 # Configurable via environment variable
 BRIDGE_URL = os.environ.get("BRIDGE_URL", "http://127.0.0.1:8765")
 TIMEOUT = 310  # Slightly longer than bridge timeout
 
+_conn: http.client.HTTPConnection | None = None
+
 
 def log_error(message: str) -> None:
     """Log error to stderr (doesn't interfere with Claude Code stdout protocol)."""
     print(f"[telegram-bridge] {message}", file=sys.stderr)
 
 
+def post_json(path: str, body: bytes) -> http.client.HTTPResponse:
+    """POST a JSON body to the bridge over a reusable keep-alive connection."""
+    global _conn
+    url = urlsplit(BRIDGE_URL)
+    if _conn is None:
+        conn_class = (
+            http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        )
+        _conn = conn_class(url.hostname, url.port, timeout=TIMEOUT)
+    _conn.request(
+        "POST",
+        url.path.rstrip("/") + path,
+        body=body,
+        headers={"Content-Type": "application/json"},
+    )
+    return _conn.getresponse()
+
+
 def main():
     """Process permission request from Claude Code."""
     # Read hook input from stdin
     try:
-        input_data = json.load(sys.stdin)
+        input_data = loads(sys.stdin.buffer.read())
     except json.JSONDecodeError as e:
         log_error(f"Failed to parse hook input: {e}")
         output_deny("Failed to parse hook input")
@@ -53,22 +84,22 @@ def main():
 
     # Send request to bridge
     try:
-        request_body = json.dumps({
+        request_body = dumps({
             "request_id": request_id,
             "tool": tool_name,
             "command": command,
             "session_id": session_id,
-        }).encode("utf-8")
+        })
 
-        req = Request(
-            f"{BRIDGE_URL}/permission",
-            data=request_body,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
+        response = post_json("/permission", request_body)
+        response_body = response.read()
+
+        if response.status >= 400:
+            log_error(f"Bridge HTTP error: {response.status} {response.reason}")
+            # Bridge error - fallback to normal Claude Code UI
+            sys.exit(0)
 
-        with urlopen(req, timeout=TIMEOUT) as response:
-            result = json.loads(response.read().decode("utf-8"))
+        result = loads(response_body)
 
         decision = result.get("decision", "deny")
 
@@ -78,17 +109,13 @@ def main():
             reason = result.get("reason", "Denied via Telegram")
             output_deny(reason)
 
-    except HTTPError as e:
-        log_error(f"Bridge HTTP error: {e.code} {e.reason}")
-        # Bridge error - fallback to normal Claude Code UI
-        sys.exit(0)
-    except URLError as e:
-        log_error(f"Bridge connection error: {e.reason} (is bridge running?)")
-        # Bridge not running - fallback to normal Claude Code UI
-        sys.exit(0)
     except TimeoutError:
         log_error("Bridge request timeout")
         output_deny("Telegram approval timeout")
+    except (OSError, http.client.HTTPException) as e:
+        log_error(f"Bridge connection error: {e} (is bridge running?)")
+        # Bridge not running - fallback to normal Claude Code UI
+        sys.exit(0)
     except Exception as e:
         log_error(f"Unexpected error: {type(e).__name__}: {e}")
         # Unknown error - fallback to normal Claude Code UI
@@ -103,7 +130,7 @@ def output_allow():
             "decision": {"behavior": "allow"},
         }
     }
-    print(json.dumps(output))
+    sys.stdout.buffer.write(dumps(output) + b"\n")
 
 
 def output_deny(reason: str):
@@ -117,7 +144,7 @@ def output_deny(reason: str):
             },
         }
     }
-    print(json.dumps(output))
+    sys.stdout.buffer.write(dumps(output) + b"\n")
 
 
 if __name__ == "__main__":
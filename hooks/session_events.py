@@ -6,16 +6,49 @@ This script sends session state updates to the bridge daemon.
 It handles SessionStart, Notification, Stop, and SessionEnd events.
 """
 
+import http.client
 import json
+import mmap
 import os
+import stat
 import sys
+import tempfile
 import time
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit
+
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:  # stdlib fallback; hooks run under the system python3
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    loads = json.loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: send each event on its own
+    fcntl = None
 
 # Configurable via environment variable
 BRIDGE_URL = os.environ.get("BRIDGE_URL", "http://127.0.0.1:8765")
 TIMEOUT = 5  # Short timeout - don't block Claude Code
+BATCH_WINDOW = 0.25  # Wait this long for the rest of a burst of events
+TRANSCRIPT_WAIT = 0.3  # Longest wait for a pending transcript write
+TRANSCRIPT_POLL = 0.01
+# Compact and spaced forms of the field that marks an assistant entry
+ASSISTANT_MARKERS = (b'"type":"assistant"', b'"type": "assistant"')
+
+_conn: http.client.HTTPConnection | None = None
+# Raised when the bridge has dropped an idle keep-alive connection
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
 
 
 def log_error(message: str) -> None:
@@ -23,12 +56,123 @@ def log_error(message: str) -> None:
     print(f"[telegram-bridge] {message}", file=sys.stderr)
 
 
-def get_tty():
-    """Get the TTY of the Claude process (parent)."""
+def get_state_dir() -> str | None:
+    """Per-user private directory for the event spool and TTY cache.
+
+    The temp dir is shared between users on Linux, so hook state lives in
+    a 0700 directory owned by the current user. Returns None if that
+    can't be guaranteed.
+    """
+    if not hasattr(os, "getuid"):
+        return tempfile.gettempdir()  # Windows: the temp dir is per-user
+    path = os.path.join(tempfile.gettempdir(), f"claude-bridge-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        log_error(f"Failed to create state dir: {e}")
+        return None
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    # Someone else may have created it first, or swapped in a symlink
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        log_error(f"Refusing to use {path}: not a private directory")
+        return None
+    return path
+
+
+def get_tty_cache_path(ppid: int) -> str | None:
+    """Path of the file caching the TTY of one Claude process."""
+    state_dir = get_state_dir()
+    return state_dir and os.path.join(state_dir, f"tty-{ppid}")
+
+
+def get_tty(ppid: int, refresh: bool = False) -> str | None:
+    """Get the TTY of the Claude process (parent), cached per PID.
+
+    A process keeps its TTY for life, so only the first hook of a session
+    pays for the lookup. Pass refresh=True to ignore the cache, e.g. when a
+    reused PID may have left an entry from an older process.
+    """
+    cache_path = get_tty_cache_path(ppid)
+    if cache_path is None:
+        return find_tty(ppid)
+    if not refresh:
+        try:
+            with open(cache_path) as f:
+                return f.read().strip() or None
+        except OSError:
+            pass
+
+    tty = find_tty(ppid)
+    if tty:
+        tmp_path = None
+        try:
+            # Write then rename, so concurrent hooks never read a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), prefix=".tty-")
+            with os.fdopen(fd, "w") as f:
+                f.write(tty)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            log_error(f"Failed to cache TTY: {e}")
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+    return tty
+
+
+def forget_tty(ppid: int) -> None:
+    """Remove the cached TTY of a Claude process that is exiting."""
+    cache_path = get_tty_cache_path(ppid)
+    if cache_path is None:
+        return
+    try:
+        os.unlink(cache_path)
+    except OSError:
+        pass
+
+
+def tty_from_proc_stat(pid: int) -> str | None:
+    """Get a process's controlling TTY from /proc/<pid>/stat (Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            # The command name may contain spaces or ')', so split after the last ')'
+            fields = f.read().rsplit(b")", 1)[1].split()
+        tty_nr = int(fields[4])
+    except (OSError, IndexError, ValueError):
+        return None
+
+    major, minor = os.major(tty_nr), os.minor(tty_nr)
+    if 136 <= major <= 143:  # Unix98 pseudo-terminals
+        return f"/dev/pts/{(major - 136) * 256 + minor}"
+    if major == 4 and minor < 64:  # Virtual consoles
+        return f"/dev/tty{minor}"
+    return None
+
+
+def find_tty(ppid: int) -> str | None:
+    """Look up the TTY of a process."""
     import subprocess
 
-    ppid = os.getppid()
+    # Linux: the controlling terminal, without spawning ps
+    tty = tty_from_proc_stat(ppid)
+    if tty:
+        return tty
 
+    # Linux: where the process's stdin points
+    try:
+        tty = os.readlink(f"/proc/{ppid}/fd/0")
+        if tty.startswith(("/dev/pts/", "/dev/tty")):
+            return tty
+    except OSError:
+        pass
+
+    # macOS and other systems without /proc
     try:
         result = subprocess.run(
             ["ps", "-p", str(ppid), "-o", "tty="],
@@ -37,7 +181,7 @@ def get_tty():
             timeout=2
         )
         tty = result.stdout.strip()
-        if tty and tty != "??" and tty != "-":
+        if tty and tty not in ("?", "??", "-"):
             if not tty.startswith("/dev/"):
                 tty = "/dev/" + tty
             return tty
@@ -52,61 +196,312 @@ def get_tty():
     return None
 
 
+def iter_lines_reversed(path: str, markers: tuple[bytes, ...] = ()):
+    """Yield the lines of a file from last to first.
+
+    Maps the file and steps back one newline at a time, so finding
+    something near the end only touches the last few pages. With
+    ``markers``, only lines containing one of them are yielded; the
+    check runs on the map, so other lines are never copied.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # Empty files can't be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            while end >= 0:
+                start = mm.rfind(b"\n", 0, end) + 1
+                if not markers or any(mm.find(m, start, end) != -1 for m in markers):
+                    yield mm[start:end]
+                end = start - 1
+
+
+def assistant_text(entry: dict) -> str | None:
+    """Get the last text block of an assistant transcript entry."""
+    if entry.get("type") != "assistant":
+        return None
+    content = entry.get("message", {}).get("content", [])
+    # Find text content (from the end of content array too)
+    for item in reversed(content):
+        if item.get("type") == "text":
+            return item.get("text", "")
+    return None
+
+
+def ends_with_assistant_text(transcript_path: str) -> bool:
+    """Check whether the transcript's last entry is an assistant message with text."""
+    try:
+        for line in iter_lines_reversed(transcript_path):
+            if not line.strip():
+                continue
+            entry = loads(line)
+            return isinstance(entry, dict) and assistant_text(entry) is not None
+    except (OSError, ValueError, AttributeError):
+        pass
+    return False
+
+
+def wait_for_transcript(transcript_path: str | None) -> None:
+    """Wait up to TRANSCRIPT_WAIT for the transcript to be written to.
+
+    Returns at once if the message is already there. Otherwise the hook
+    fired just before Claude Code appended it, so return as soon as the
+    file grows.
+    """
+    if not transcript_path:
+        return
+    try:
+        size = os.stat(transcript_path).st_size
+    except OSError:
+        return
+    if ends_with_assistant_text(transcript_path):
+        return
+
+    deadline = time.monotonic() + TRANSCRIPT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(TRANSCRIPT_POLL)
+        try:
+            if os.stat(transcript_path).st_size != size:
+                return
+        except OSError:
+            return
+
+
 def get_last_assistant_message(transcript_path: str) -> str | None:
     """Read the last assistant message from transcript file."""
     if not transcript_path:
         return None
 
     try:
-        # Read all lines and reverse to find last assistant message
-        with open(transcript_path, 'r') as f:
-            lines = f.readlines()
-
-        # Go through lines from the end
-        for line in reversed(lines):
+        # Go through lines from the end that can be assistant entries
+        for line in iter_lines_reversed(transcript_path, ASSISTANT_MARKERS):
             try:
-                entry = json.loads(line.strip())
-                if entry.get("type") == "assistant":
-                    msg = entry.get("message", {})
-                    content = msg.get("content", [])
-                    # Find text content (from the end of content array too)
-                    for item in reversed(content):
-                        if item.get("type") == "text":
-                            return item.get("text", "")
+                text = assistant_text(loads(line))
             except json.JSONDecodeError:
                 continue
+            if text is not None:
+                return text
         return None
     except Exception as e:
         log_error(f"Failed to read transcript: {e}")
         return None
 
 
-def send_event(data: dict) -> None:
-    """Send event to bridge daemon."""
+def post_json(path: str, body: bytes) -> http.client.HTTPResponse:
+    """POST a JSON body to the bridge over a reusable keep-alive connection.
+
+    If a reused connection turns out to have been closed by the bridge,
+    reconnects and retries once.
+    """
+    global _conn
+    url = urlsplit(BRIDGE_URL)
+    while True:
+        reused = _conn is not None
+        if _conn is None:
+            conn_class = (
+                http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+            )
+            _conn = conn_class(url.hostname, url.port, timeout=TIMEOUT)
+        try:
+            _conn.request(
+                "POST",
+                url.path.rstrip("/") + path,
+                body=body,
+                headers={"Content-Type": "application/json"},
+            )
+            return _conn.getresponse()
+        except STALE_CONNECTION_ERRORS:
+            _conn.close()
+            _conn = None
+            if not reused:
+                raise
+
+
+def send_events(events: list[dict]) -> None:
+    """Send a batch of events to bridge daemon."""
     try:
-        request_body = json.dumps(data).encode("utf-8")
-        req = Request(
-            f"{BRIDGE_URL}/session",
-            data=request_body,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        with urlopen(req, timeout=TIMEOUT) as response:
+        request_body = dumps({"events": events})
+        response = post_json("/session", request_body)
+        # Success is a bodiless 204; only errors carry a body to drain
+        if response.status >= 400:
             response.read()
-    except HTTPError as e:
-        log_error(f"Bridge HTTP error: {e.code} {e.reason}")
-    except URLError as e:
-        log_error(f"Bridge connection error: {e.reason}")
+            log_error(f"Bridge HTTP error: {response.status} {response.reason}")
+        # Release the keep-alive connection for the next request
+        response.close()
     except TimeoutError:
         log_error("Bridge request timeout")
+    except (OSError, http.client.HTTPException) as e:
+        log_error(f"Bridge connection error: {e}")
     except Exception as e:
         log_error(f"Unexpected error: {type(e).__name__}: {e}")
 
 
+def get_spool_path(ppid: int) -> str | None:
+    """Path of the file queueing events for one Claude process."""
+    state_dir = get_state_dir()
+    return state_dir and os.path.join(state_dir, f"events-{ppid}.ndjson")
+
+
+def queue_event(data: dict, ppid: int) -> bool:
+    """Append an event to the spool. Returns False if it has to be sent directly."""
+    if fcntl is None:
+        return False
+    spool_path = get_spool_path(ppid)
+    if spool_path is None:
+        return False
+    try:
+        while True:
+            fd = os.open(spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "ab") as spool:
+                fcntl.flock(spool, fcntl.LOCK_EX)
+                if os.fstat(spool.fileno()).st_nlink == 0:
+                    # A SessionEnd flush removed it while we waited; reopen
+                    continue
+                spool.write(dumps(data) + b"\n")
+                return True
+    except OSError as e:
+        log_error(f"Failed to queue event: {e}")
+        return False
+
+
+def read_queued_events(spool_path: str) -> list[dict]:
+    """Take all events from the spool, removing it after a SessionEnd."""
+    events = []
+    try:
+        with open(spool_path, "r+b") as spool:
+            fcntl.flock(spool, fcntl.LOCK_EX)
+            lines = spool.read().splitlines()
+            spool.truncate(0)
+            for line in lines:
+                try:
+                    events.append(loads(line))
+                except ValueError:
+                    log_error(f"Skipping malformed queued event: {line[:100]!r}")
+            if any(event.get("event") == "SessionEnd" for event in events):
+                # Still holding the lock; late appenders see st_nlink == 0
+                os.unlink(spool_path)
+    except FileNotFoundError:
+        pass  # Already flushed and removed by the SessionEnd hook
+    except OSError as e:
+        log_error(f"Failed to read queued events: {e}")
+    return events
+
+
+def flush_events(ppid: int) -> None:
+    """Send all queued events for a Claude process in one request.
+
+    Every hook calls this after BATCH_WINDOW. The first to take the lock
+    sends the whole burst; the others find the spool empty. The spool is
+    removed once it has held the session's SessionEnd.
+    """
+    time.sleep(BATCH_WINDOW)
+    spool_path = get_spool_path(ppid)
+    if spool_path is None:
+        return
+    try:
+        dir_fd = os.open(os.path.dirname(spool_path), os.O_RDONLY)
+    except OSError as e:
+        log_error(f"Failed to open state dir: {e}")
+        return
+    try:
+        # Held from read to response, so batches reach the bridge in the
+        # order they were queued. Appends only take the spool's own lock,
+        # so Claude Code never waits on a POST.
+        fcntl.flock(dir_fd, fcntl.LOCK_EX)
+        events = read_queued_events(spool_path)
+        if events:
+            send_events(events)
+    finally:
+        os.close(dir_fd)
+
+
+def detach() -> bool:
+    """Fork into the background so Claude Code doesn't wait on the bridge.
+
+    Returns True in the process that should carry on: the detached child,
+    or the hook itself when forking isn't possible.
+    """
+    if not hasattr(os, "fork"):
+        return True
+    try:
+        pid = os.fork()
+    except OSError:
+        return True
+    if pid:
+        return False
+
+    os.setsid()
+    # Release Claude Code's stdio pipes so it sees the hook as finished
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+    return True
+
+
+def add_last_message(data: dict, payload: dict) -> None:
+    """Mark the session idle, with Claude's last message from the transcript."""
+    payload["status"] = "waiting_for_input"
+    # Give Claude Code a moment to finish writing the transcript
+    transcript_path = data.get("transcript_path")
+    wait_for_transcript(transcript_path)
+    last_msg = get_last_assistant_message(transcript_path)
+    payload["message"] = last_msg or "No message"
+
+
+def handle_session_start(data: dict, payload: dict) -> None:
+    """Mark a new session as processing."""
+    payload["status"] = "processing"
+
+
+def handle_notification(data: dict, payload: dict) -> None:
+    """Add a notification, with the last message if Claude is waiting for input."""
+    notification_type = data.get("notification_type")
+    payload["notification_type"] = notification_type
+    if notification_type == "idle_prompt":
+        add_last_message(data, payload)
+    else:
+        payload["status"] = "notification"
+        payload["message"] = data.get("message")
+
+
+def handle_stop(data: dict, payload: dict) -> None:
+    """Mark the session idle once Claude finishes responding."""
+    add_last_message(data, payload)
+
+
+def handle_session_end(data: dict, payload: dict) -> None:
+    """Mark the session as ended."""
+    payload["status"] = "ended"
+
+
+def handle_pre_tool_use(data: dict, payload: dict) -> None:
+    """Record the tool Claude is about to run."""
+    payload["status"] = "running_tool"
+    payload["tool"] = data.get("tool_name")
+
+
+def handle_post_tool_use(data: dict, payload: dict) -> None:
+    """Record the tool that just finished; Claude is processing again."""
+    payload["status"] = "processing"
+    payload["tool"] = data.get("tool_name")
+
+
+# Hook event -> function adding its fields to the payload; others are ignored
+EVENT_HANDLERS = {
+    "SessionStart": handle_session_start,
+    "Notification": handle_notification,
+    "Stop": handle_stop,
+    "SessionEnd": handle_session_end,
+    "PreToolUse": handle_pre_tool_use,
+    "PostToolUse": handle_post_tool_use,
+}
+
+
 def main():
     """Process session event from Claude Code."""
     try:
-        data = json.load(sys.stdin)
+        data = loads(sys.stdin.buffer.read())
     except json.JSONDecodeError as e:
         log_error(f"Failed to parse hook input: {e}")
         sys.exit(0)
@@ -115,9 +510,15 @@ def main():
     event = data.get("hook_event_name", "")
     cwd = data.get("cwd", "")
 
+    # Unknown event, skip before paying for any lookups
+    handler = EVENT_HANDLERS.get(event)
+    if handler is None:
+        sys.exit(0)
+
     # Get process info
     claude_pid = os.getppid()
-    tty = get_tty()
+    # A new session may be running under a PID an old one used
+    tty = get_tty(claude_pid, refresh=event == "SessionStart")
 
     # Build event payload
     payload = {
@@ -129,51 +530,19 @@ def main():
     }
 
     # Add event-specific data
-    if event == "SessionStart":
-        payload["status"] = "processing"
-
-    elif event == "Notification":
-        notification_type = data.get("notification_type")
-        payload["notification_type"] = notification_type
-
-        if notification_type == "idle_prompt":
-            payload["status"] = "waiting_for_input"
-            # Small delay to ensure transcript is written
-            time.sleep(0.3)
-            # Get actual last message from transcript
-            transcript_path = data.get("transcript_path")
-            last_msg = get_last_assistant_message(transcript_path)
-            payload["message"] = last_msg or "No message"
+    handler(data, payload)
+    if event == "SessionEnd":
+        # The TTY is in the payload; no later hook of this process needs it
+        forget_tty(claude_pid)
+
+    # Queue before forking so events keep their order, then send the
+    # batch without making Claude Code wait for the response
+    queued = queue_event(payload, claude_pid)
+    if detach():
+        if queued:
+            flush_events(claude_pid)
         else:
-            payload["status"] = "notification"
-            payload["message"] = data.get("message")
-
-    elif event == "Stop":
-        payload["status"] = "waiting_for_input"
-        # Small delay to ensure transcript is written
-        time.sleep(0.3)
-        # Get actual last message from transcript
-        transcript_path = data.get("transcript_path")
-        last_msg = get_last_assistant_message(transcript_path)
-        payload["message"] = last_msg or "No message"
-
-    elif event == "SessionEnd":
-        payload["status"] = "ended"
-
-    elif event == "PreToolUse":
-        payload["status"] = "running_tool"
-        payload["tool"] = data.get("tool_name")
-
-    elif event == "PostToolUse":
-        payload["status"] = "processing"
-        payload["tool"] = data.get("tool_name")
-
-    else:
-        # Unknown event, skip
-        sys.exit(0)
-
-    # Send to bridge
-    send_event(payload)
+            send_events([payload])
 
 
 if __name__ == "__main__":